@@ -3,24 +3,25 @@ import sys
 import argparse
 import getpass
 from tabulate import tabulate
-from datetime import datetime
 from main import CryptoVault
 
+SIZE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB')
+FANCY_GRID_MAX_ROWS = 1000
+
 def get_size_str(size_bytes):
-    for unit in ['B', 'KB', 'MB', 'GB']:
-        if size_bytes < 1024.0:
-            return f"{size_bytes:.2f} {unit}"
-        size_bytes /= 1024.0
-    return f"{size_bytes:.2f} TB"
+    index = min(max(0, (int(size_bytes).bit_length() - 1) // 10), len(SIZE_UNITS) - 1)
+    return f"{size_bytes / (1 << (10 * index)):.2f} {SIZE_UNITS[index]}"
 
 def encrypt_command(args):
     vault = CryptoVault(args.vault_path)
     password = args.password or getpass.getpass("Введите пароль для шифрования: ")
     
     try:
-        file_id = vault.encrypt_file(args.file, password)
-        print(f"✅ Файл успешно зашифрован")
-        print(f"📝 ID файла: {file_id}")
+        file_ids = vault.encrypt_files(args.files, password)
+        vault.flush()
+        for file_path, file_id in zip(args.files, file_ids):
+            print(f"✅ Файл {file_path} успешно зашифрован")
+            print(f"📝 ID файла: {file_id}")
     except Exception as e:
         print(f"❌ Ошибка: {e}")
         sys.exit(1)
@@ -44,19 +45,20 @@ def list_command(args):
         print("📂 Хранилище пусто")
         return
     
-    table_data = []
-    for file in files:
-        id_display = file["id"][:8] + "..." if not args.full_id else file["id"]
-        timestamp = datetime.fromisoformat(file["timestamp"])
-        date_str = timestamp.strftime("%Y-%m-%d %H:%M:%S")
-        size_str = get_size_str(file["size"])
-        
-        table_data.append([id_display, file["filename"], date_str, size_str])
+    table_data = [
+        [
+            file["id"] if args.full_id else file["id"][:8] + "...",
+            file["filename"],
+            file["timestamp"][:19].replace("T", " "),
+            get_size_str(file["size"])
+        ]
+        for file in files
+    ]
     
     print(tabulate(
         table_data,
         headers=["ID", "Имя файла", "Дата", "Размер"],
-        tablefmt="fancy_grid"
+        tablefmt="fancy_grid" if len(table_data) <= FANCY_GRID_MAX_ROWS else "plain"
     ))
     print(f"Всего файлов: {len(files)}")
 
@@ -77,11 +79,11 @@ def info_command(args):
         total_size = 0
         file_count = 0
         
-        for file_id in os.listdir(vault.files_path):
-            file_path = os.path.join(vault.files_path, file_id)
-            if os.path.isfile(file_path):
-                total_size += os.path.getsize(file_path)
-                file_count += 1
+        with os.scandir(vault.files_path) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    total_size += entry.stat().st_size
+                    file_count += 1
         
         print("📊 Информация о хранилище:")
         print(f"📁 Путь: {vault.vault_path}")
@@ -102,8 +104,8 @@ def main():
     subparsers = parser.add_subparsers(dest="command", help="Команды")
     subparsers.required = True
     
-    encrypt_parser = subparsers.add_parser("encrypt", help="Зашифровать файл")
-    encrypt_parser.add_argument("file", help="Путь к файлу для шифрования")
+    encrypt_parser = subparsers.add_parser("encrypt", help="Зашифровать один или несколько файлов")
+    encrypt_parser.add_argument("files", nargs="+", help="Пути к файлам для шифрования")
     encrypt_parser.add_argument("-p", "--password", help="Пароль для шифрования (если не указан, будет запрошен)")
     encrypt_parser.set_defaults(func=encrypt_command)
     
@@ -1,19 +1,241 @@
 import os
 import sys
+import ast
+import json
 import hashlib
 import base64
+import mmap
+import queue
 import secrets
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+import sqlite3
+import stat
+import struct
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from datetime import datetime
 
+CHUNK_SIZE = 64 * 1024
+LARGE_CHUNK_SIZE = 1024 * 1024
+HUGE_CHUNK_SIZE = 8 * 1024 * 1024
+LARGE_FILE_THRESHOLD = 1024 * 1024
+HUGE_FILE_THRESHOLD = 1024 * 1024 * 1024
+IO_BUFFER_SIZE = 1024 * 1024
+KDF_ITERATIONS = 100000
+KEY_CACHE_SIZE = 128
+KEY_CACHE_TTL = 300
+CIPHER_FERNET = "fernet"
+CIPHER_AES_GCM = "aes-gcm"
+NONCE_PREFIX_SIZE = 8
+TAG_SIZE = 16
+MAX_SEALED_CHUNK_SIZE = HUGE_CHUNK_SIZE + TAG_SIZE
+LENGTH_PREFIX = struct.Struct(">I")
+CHUNK_COUNTER = struct.Struct(">I")
+MIDDLE_CHUNK = b"\x00"
+LAST_CHUNK = b"\x01"
+SQLITE_HEADER = b"SQLite format 3\x00"
+INDEX_COLUMNS = (
+    ("id", "TEXT PRIMARY KEY"),
+    ("original_path", "TEXT"),
+    ("original_filename", "TEXT"),
+    ("timestamp", "TEXT"),
+    ("salt", "TEXT"),
+    ("size", "INTEGER"),
+    ("cipher", "TEXT"),
+    ("nonce", "TEXT"),
+    ("wrapped_key", "TEXT"),
+    ("key_nonce", "TEXT"),
+)
+
+def chunk_size_for(size):
+    if size is None:
+        return LARGE_CHUNK_SIZE
+    if size >= HUGE_FILE_THRESHOLD:
+        return HUGE_CHUNK_SIZE
+    if size >= LARGE_FILE_THRESHOLD:
+        return LARGE_CHUNK_SIZE
+    return CHUNK_SIZE
+
+def advise_sequential(f):
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+def read_chunks(f, chunk_size=CHUNK_SIZE):
+    # Первый блок отдаётся всегда, даже пустой: так у пустого файла
+    # тоже есть токен и неверный пароль обнаруживается при расшифровке
+    chunk = f.read(chunk_size)
+    yield chunk
+    while chunk := f.read(chunk_size):
+        yield chunk
+
+def mmap_chunks(f, chunk_size=CHUNK_SIZE):
+    try:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (ValueError, OSError):
+        # Пустые файлы и файлы, которые нельзя отобразить в память
+        yield from read_chunks(f, chunk_size)
+        return
+    with mm:
+        if hasattr(mmap, "MADV_SEQUENTIAL"):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        for offset in range(0, len(mm), chunk_size):
+            yield mm[offset:offset + chunk_size]
+
+def prefetch_chunks(chunks, depth=2):
+    # Блоки читаются в отдельном потоке, пока основной поток шифрует
+    # и записывает предыдущие; очередь ограничивает опережение чтения
+    pending = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    
+    def put(item):
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+        
+    def produce():
+        try:
+            for chunk in chunks:
+                if not put((chunk, None)):
+                    return
+        except BaseException as e:
+            put((None, e))
+        else:
+            put((None, None))
+            
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk, error = pending.get()
+            if error is not None:
+                raise error
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        stop.set()
+        thread.join()
+
+def stream_encrypt(aead, nonce_prefix, chunks, dst):
+    # Nonce блока = префикс файла + номер блока; последний блок помечается
+    # через associated data, поэтому перестановка и обрезка блоков
+    # обнаруживаются при расшифровке
+    encrypt = aead.encrypt
+    # encrypt_into есть в новых версиях cryptography: шифротекст пишется
+    # в один переиспользуемый буфер вместо нового объекта на каждый блок
+    encrypt_into = getattr(aead, "encrypt_into", None)
+    sealed_buffer = memoryview(bytearray())
+    pack = LENGTH_PREFIX.pack
+    pack_counter = CHUNK_COUNTER.pack
+    write = dst.write
+    chunks = iter(chunks)
+    chunk = next(chunks)
+    index = 0
+    size = 0
+    while True:
+        next_chunk = next(chunks, None)
+        aad = LAST_CHUNK if next_chunk is None else MIDDLE_CHUNK
+        nonce = nonce_prefix + pack_counter(index)
+        if encrypt_into is None:
+            sealed = encrypt(nonce, chunk, aad)
+        else:
+            sealed_size = len(chunk) + TAG_SIZE
+            if len(sealed_buffer) < sealed_size:
+                sealed_buffer = memoryview(bytearray(sealed_size))
+            sealed = sealed_buffer[:sealed_size]
+            encrypt_into(nonce, chunk, aad, sealed)
+        write(pack(len(sealed)))
+        write(sealed)
+        size += len(chunk)
+        if next_chunk is None:
+            return size
+        chunk = next_chunk
+        index += 1
+
+def stream_decrypt(aead, nonce_prefix, src):
+    decrypt = aead.decrypt
+    unpack = LENGTH_PREFIX.unpack
+    pack_counter = CHUNK_COUNTER.pack
+    read = src.read
+    header_size = LENGTH_PREFIX.size
+    index = 0
+    while header := read(header_size):
+        (length,) = unpack(header)
+        if length > MAX_SEALED_CHUNK_SIZE:
+            raise InvalidTag()
+        sealed = read(length)
+        aad = MIDDLE_CHUNK if src.peek(1) else LAST_CHUNK
+        yield decrypt(nonce_prefix + pack_counter(index), sealed, aad)
+        index += 1
+        if aad == LAST_CHUNK:
+            return
+    raise InvalidTag()
+
+def stream_decrypt_into(aead, nonce_prefix, src):
+    # То же, что stream_decrypt, но блоки читаются и расшифровываются в
+    # переиспользуемые буферы: отданный memoryview действителен только
+    # до следующей итерации
+    decrypt_into = aead.decrypt_into
+    unpack = LENGTH_PREFIX.unpack
+    pack_counter = CHUNK_COUNTER.pack
+    read = src.read
+    readinto = src.readinto
+    header_size = LENGTH_PREFIX.size
+    sealed_buffer = plain_buffer = memoryview(bytearray())
+    index = 0
+    while header := read(header_size):
+        (length,) = unpack(header)
+        # Длина блока не аутентифицирована: без ограничения подменённый
+        # заголовок заставил бы выделить гигабайты под буферы
+        if length > MAX_SEALED_CHUNK_SIZE:
+            raise InvalidTag()
+        if len(sealed_buffer) < length:
+            sealed_buffer = memoryview(bytearray(length))
+            plain_buffer = memoryview(bytearray(length))
+        sealed = sealed_buffer[:readinto(sealed_buffer[:length])]
+        if len(sealed) < TAG_SIZE:
+            raise InvalidTag()
+        aad = MIDDLE_CHUNK if src.peek(1) else LAST_CHUNK
+        plain = plain_buffer[:len(sealed) - TAG_SIZE]
+        decrypt_into(nonce_prefix + pack_counter(index), sealed, aad, plain)
+        yield plain
+        index += 1
+        if aad == LAST_CHUNK:
+            return
+    raise InvalidTag()
+
+def fernet_stream_decrypt(fernet, src):
+    # Файлы старого формата: весь файл - один токен Fernet
+    yield fernet.decrypt(src.read())
+
+def _prepend(first, rest):
+    yield first
+    yield from rest
+
 class CryptoVault:
     def __init__(self, vault_path=None):
         self.vault_path = vault_path or os.path.join(os.path.expanduser("~"), ".cryptovault")
         self.index_path = os.path.join(self.vault_path, "index.db")
         self.files_path = os.path.join(self.vault_path, "files")
         self.metadata_path = os.path.join(self.vault_path, "metadata")
+        self._files_prefix = self.files_path + os.sep
+        self._metadata_prefix = self.metadata_path + os.sep
+        self._key_cache = OrderedDict()
+        self._key_cache_lock = threading.Lock()
+        self._index_lock = threading.Lock()
+        self._vault_salt = None
+        self._file_count = 0
+        self._file_count_lock = threading.Lock()
+        self._unsynced = set()
+        self._unsynced_lock = threading.Lock()
         self.initialize_vault()
         
     def initialize_vault(self):
@@ -21,115 +243,359 @@ class CryptoVault:
             if not os.path.exists(path):
                 os.makedirs(path)
                 
-        if not os.path.exists(self.index_path):
-            with open(self.index_path, "w") as f:
-                f.write("{}")
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "rb") as f:
+                is_sqlite = f.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+            if not is_sqlite:
+                # Раньше index.db был пустым JSON-файлом "{}"
+                os.remove(self.index_path)
+                
+        self._index = sqlite3.connect(self.index_path, check_same_thread=False)
+        self._index.row_factory = sqlite3.Row
+        with self._index_lock, self._index:
+            self._index.execute("CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT)")
+            existing = {row["name"] for row in self._index.execute("PRAGMA table_info(files)")}
+            for name, type_ in INDEX_COLUMNS:
+                if existing and name not in existing:
+                    self._index.execute(f"ALTER TABLE files ADD COLUMN {name} {type_}")
+                        
+        if not existing:
+            entries = self._scan_metadata()
+            columns = ", ".join(f"{name} {type_}" for name, type_ in INDEX_COLUMNS)
+            # Таблица создаётся и заполняется в одной транзакции: если
+            # заполнение прервётся, при следующем открытии индекс соберётся заново
+            with self._index_lock, self._index:
+                self._index.execute("BEGIN")
+                self._index.execute(f"CREATE TABLE files ({columns})")
+                self._insert_metadata(entries)
                 
+        self.refresh_file_count()
+            
+    @property
+    def file_count(self):
+        return self._file_count
+        
+    def refresh_file_count(self):
+        with os.scandir(self.files_path) as entries:
+            count = sum(1 for entry in entries if entry.is_file())
+        with self._file_count_lock:
+            self._file_count = count
+            
+    def _add_file_count(self, delta):
+        with self._file_count_lock:
+            self._file_count += delta
+            
+    def _sync_written(self, f):
+        # Файл сбрасывается на диск через свой дескриптор до закрытия: на
+        # Windows fsync требует дескриптор, открытый на запись. Каталог
+        # запоминается и синхронизируется один раз за пакет в flush()
+        f.flush()
+        os.fsync(f.fileno())
+        with self._unsynced_lock:
+            self._unsynced.add(os.path.dirname(f.name))
+            
+    def flush(self):
+        with self._unsynced_lock:
+            directories, self._unsynced = self._unsynced, set()
+        for directory in directories:
+            try:
+                fd = os.open(directory, os.O_RDONLY)
+            except OSError:
+                # Каталоги нельзя открыть на Windows
+                continue
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            
+    def rebuild_index(self):
+        self._index_metadata(self._scan_metadata())
+        
+    def _scan_metadata(self):
+        with os.scandir(self.metadata_path) as scan:
+            paths = [entry.path for entry in scan if entry.is_file()]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            metadata = list(executor.map(self._read_metadata_safe, paths))
+        return [(os.path.basename(path), meta) for path, meta in zip(paths, metadata) if meta is not None]
+        
+    def register_metadata(self, file_id):
+        metadata = self._read_metadata(self.metadata_file_path(file_id))
+        self._index_metadata([(file_id, metadata)])
+        return metadata
+                
+    def get_vault_salt(self):
+        if self._vault_salt is None:
+            with self._index_lock, self._index:
+                self._index.execute(
+                    "INSERT OR IGNORE INTO settings (name, value) VALUES ('salt', ?)",
+                    (base64.b64encode(secrets.token_bytes(16)).decode(),)
+                )
+                row = self._index.execute("SELECT value FROM settings WHERE name = 'salt'").fetchone()
+            self._vault_salt = base64.b64decode(row["value"])
+        return self._vault_salt
+        
     def generate_key(self, password, salt=None):
         if salt is None:
             salt = secrets.token_bytes(16)
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt,
-            iterations=100000,
-        )
-        key = base64.urlsafe_b64encode(kdf.derive(password.encode()))
+        key = base64.urlsafe_b64encode(self._derive_key(password, salt))
         return key, salt
     
-    def encrypt_file(self, file_path, password):
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"File {file_path} not found")
+    def _derive_key(self, password, salt):
+        password = password.encode()
+        cache_key = (hashlib.sha256(password).digest(), salt)
+        with self._key_cache_lock:
+            self._purge_expired_keys()
+            entry = self._key_cache.get(cache_key)
+            if entry is not None:
+                return entry[0]
             
-        file_id = self.generate_file_id(file_path)
-        key, salt = self.generate_key(password)
-        fernet = Fernet(key)
-        
-        with open(file_path, "rb") as f:
-            data = f.read()
-            
-        encrypted_data = fernet.encrypt(data)
-        encrypted_path = os.path.join(self.files_path, file_id)
-        
-        with open(encrypted_path, "wb") as f:
-            f.write(encrypted_data)
-            
-        self.save_metadata(file_id, file_path, salt)
+        # dklen равен длине SHA-256, поэтому PBKDF2 считает ровно один блок
+        key = hashlib.pbkdf2_hmac("sha256", password, salt, KDF_ITERATIONS, dklen=32)
+        with self._key_cache_lock:
+            self._purge_expired_keys()
+            self._key_cache[cache_key] = (key, time.monotonic() + KEY_CACHE_TTL)
+            self._key_cache.move_to_end(cache_key)
+            if len(self._key_cache) > KEY_CACHE_SIZE:
+                self._key_cache.popitem(last=False)
+        return key
+    
+    def _purge_expired_keys(self):
+        # Записи лежат в порядке добавления, то есть по возрастанию срока
+        # действия, поэтому устаревшие всегда находятся в начале
+        now = time.monotonic()
+        while self._key_cache:
+            cache_key, (_, deadline) = next(iter(self._key_cache.items()))
+            if deadline > now:
+                break
+            del self._key_cache[cache_key]
+    
+    def clear_key_cache(self):
+        with self._key_cache_lock:
+            self._key_cache.clear()
+    
+    def encrypt_file(self, file_path, password):
+        return self.encrypt_files([file_path], password)[0]
+    
+    def encrypt_files(self, file_paths, password):
+        for file_path in file_paths:
+            if not os.path.exists(file_path):
+                raise FileNotFoundError(f"File {file_path} not found")
+                
+        entries = []
+        try:
+            for file_path in file_paths:
+                with open(file_path, "rb") as src:
+                    chunk_size = chunk_size_for(os.fstat(src.fileno()).st_size)
+                    file_id, encryption, size = self._encrypt_chunks(mmap_chunks(src, chunk_size), password)
+                entries.append((file_id, self._write_metadata(file_id, file_path, size, encryption)))
+        finally:
+            self._index_metadata(entries)
+        return [file_id for file_id, _ in entries]
+    
+    def encrypt_stream(self, fileobj, password, original_name, size=None):
+        chunks = read_chunks(fileobj, chunk_size_for(size))
+        file_id, encryption, size = self._encrypt_chunks(prefetch_chunks(chunks), password)
+        self.save_metadata(file_id, original_name, size, encryption)
         return file_id
     
-    def decrypt_file(self, file_id, password, output_path=None):
-        encrypted_path = os.path.join(self.files_path, file_id)
-        metadata_path = os.path.join(self.metadata_path, file_id)
+    def _encrypt_chunks(self, chunks, password):
+        file_id = self.generate_file_id()
+        salt = self.get_vault_salt()
+        master_key = self._derive_key(password, salt)
+        data_key = AESGCM.generate_key(bit_length=256)
+        key_nonce = secrets.token_bytes(12)
+        wrapped_key = AESGCM(master_key).encrypt(key_nonce, data_key, file_id.encode())
+        nonce_prefix = secrets.token_bytes(NONCE_PREFIX_SIZE)
+        aead = AESGCM(data_key)
+        encrypted_path = self.file_path(file_id)
         
-        if not os.path.exists(encrypted_path) or not os.path.exists(metadata_path):
-            raise FileNotFoundError(f"File {file_id} not found in vault")
+        try:
+            with open(encrypted_path, "wb", buffering=IO_BUFFER_SIZE) as dst:
+                size = stream_encrypt(aead, nonce_prefix, chunks, dst)
+                self._sync_written(dst)
+        except BaseException:
+            if os.path.exists(encrypted_path):
+                os.remove(encrypted_path)
+            raise
+        self._add_file_count(1)
             
-        with open(metadata_path, "r") as f:
-            metadata = eval(f.read())
+        return file_id, {
+            "salt": base64.b64encode(salt).decode(),
+            "cipher": CIPHER_AES_GCM,
+            "nonce": base64.b64encode(nonce_prefix).decode(),
+            "wrapped_key": base64.b64encode(wrapped_key).decode(),
+            "key_nonce": base64.b64encode(key_nonce).decode()
+        }, size
+    
+    def _unwrap_key(self, file_id, metadata, password):
+        key = self._derive_key(password, base64.b64decode(metadata["salt"]))
+        if not metadata.get("wrapped_key"):
+            return key
+        return AESGCM(key).decrypt(
+            base64.b64decode(metadata["key_nonce"]),
+            base64.b64decode(metadata["wrapped_key"]),
+            file_id.encode()
+        )
+    
+    def decrypt_file(self, file_id, password, output_path=None, metadata=None):
+        metadata = self._require_metadata(file_id, metadata)
+        output_path = output_path or metadata["original_path"]
+        chunks = self._decrypt_chunks(file_id, metadata, password, reuse_buffers=True)
+        # Символическая ссылка сохраняется, заменяется файл, на который она указывает
+        target_path = os.path.realpath(output_path)
+        try:
+            target_stat = os.stat(target_path)
+        except FileNotFoundError:
+            target_stat = None
             
-        salt = metadata["salt"]
-        original_path = metadata["original_path"]
-        
-        key, _ = self.generate_key(password, salt=base64.b64decode(salt))
-        fernet = Fernet(key)
-        
-        with open(encrypted_path, "rb") as f:
-            encrypted_data = f.read()
+        if target_stat is not None and not stat.S_ISREG(target_stat.st_mode):
+            # Устройства и каналы (например /dev/stdout) нельзя подменить файлом
+            with open(target_path, "wb", buffering=IO_BUFFER_SIZE) as dst:
+                for chunk in chunks:
+                    dst.write(chunk)
+            return output_path
             
+        # Временный файл создаётся с режимом 0o666 с учётом umask, как при
+        # обычном open(); у существующего файла сохраняются его права
+        temp_path = os.path.join(
+            os.path.dirname(target_path),
+            f".{os.path.basename(target_path)}.{secrets.token_hex(8)}.tmp"
+        )
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o666)
         try:
-            decrypted_data = fernet.decrypt(encrypted_data)
-        except Exception:
-            raise ValueError("Invalid password or corrupted file")
-        
-        output_path = output_path or original_path
-        with open(output_path, "wb") as f:
-            f.write(decrypted_data)
+            with os.fdopen(fd, "wb", buffering=IO_BUFFER_SIZE) as dst:
+                if target_stat is not None:
+                    os.chmod(temp_path, stat.S_IMODE(target_stat.st_mode))
+                for chunk in chunks:
+                    dst.write(chunk)
+            os.replace(temp_path, target_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
             
         return output_path
     
-    def generate_file_id(self, file_path):
-        filename = os.path.basename(file_path)
-        timestamp = datetime.now().isoformat()
-        random_suffix = secrets.token_hex(4)
-        data = f"{filename}_{timestamp}_{random_suffix}"
-        return hashlib.sha256(data.encode()).hexdigest()
+    def decrypt_stream(self, file_id, password, metadata=None):
+        metadata = self._require_metadata(file_id, metadata)
+        chunks = self._decrypt_chunks(file_id, metadata, password)
+        # Первый блок расшифровывается сразу, чтобы неверный пароль
+        # обнаружился до того, как вызывающий код начнёт отдавать данные
+        return _prepend(next(chunks, b""), chunks)
+    
+    def _require_metadata(self, file_id, metadata=None):
+        if metadata is None:
+            metadata = self.get_metadata(file_id)
+        if metadata is None or not os.path.exists(self.file_path(file_id)):
+            raise FileNotFoundError(f"File {file_id} not found in vault")
+        return metadata
+    
+    def _decrypt_chunks(self, file_id, metadata, password, reuse_buffers=False):
+        cipher = metadata.get("cipher") or CIPHER_FERNET
+        with open(self.file_path(file_id), "rb", buffering=IO_BUFFER_SIZE) as src:
+            advise_sequential(src)
+            try:
+                if cipher == CIPHER_AES_GCM:
+                    aead = AESGCM(self._unwrap_key(file_id, metadata, password))
+                    decrypt = stream_decrypt_into if reuse_buffers and hasattr(aead, "decrypt_into") else stream_decrypt
+                    yield from decrypt(aead, base64.b64decode(metadata["nonce"]), src)
+                else:
+                    key, _ = self.generate_key(password, base64.b64decode(metadata["salt"]))
+                    yield from fernet_stream_decrypt(Fernet(key), src)
+            except (InvalidToken, InvalidTag, struct.error):
+                raise ValueError("Invalid password or corrupted file")
     
-    def save_metadata(self, file_id, original_path, salt):
+    def file_path(self, file_id):
+        return self._files_prefix + file_id
+    
+    def metadata_file_path(self, file_id):
+        return self._metadata_prefix + file_id
+    
+    def generate_file_id(self):
+        return secrets.token_hex(16)
+    
+    def get_metadata(self, file_id):
+        with self._index_lock:
+            row = self._index.execute("SELECT * FROM files WHERE id = ?", (file_id,)).fetchone()
+        if row is not None:
+            return dict(row)
+            
+        if os.path.exists(self.metadata_file_path(file_id)):
+            return self.register_metadata(file_id)
+        return None
+    
+    def save_metadata(self, file_id, original_path, size, encryption):
+        metadata = self._write_metadata(file_id, original_path, size, encryption)
+        self._index_metadata([(file_id, metadata)])
+        
+    def _write_metadata(self, file_id, original_path, size, encryption):
         metadata = {
             "original_path": original_path,
             "original_filename": os.path.basename(original_path),
             "timestamp": datetime.now().isoformat(),
-            "salt": base64.b64encode(salt).decode(),
-            "size": os.path.getsize(original_path)
+            "size": size,
+            **encryption
         }
         
-        metadata_path = os.path.join(self.metadata_path, file_id)
+        metadata_path = self.metadata_file_path(file_id)
         with open(metadata_path, "w") as f:
-            f.write(str(metadata))
+            json.dump(metadata, f)
+            self._sync_written(f)
+        return metadata
+    
+    def _index_metadata(self, entries):
+        with self._index_lock, self._index:
+            self._insert_metadata(entries)
+            
+    def _insert_metadata(self, entries):
+        names = [name for name, _ in INDEX_COLUMNS]
+        query = f"INSERT OR REPLACE INTO files ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})"
+        rows = [[file_id] + [metadata.get(name) for name in names[1:]] for file_id, metadata in entries]
+        self._index.executemany(query, rows)
+    
+    def _read_metadata(self, metadata_path):
+        with open(metadata_path, "r") as f:
+            data = f.read()
+        try:
+            return json.loads(data)
+        except json.JSONDecodeError:
+            # Метаданные старого формата записывались как str(dict)
+            return ast.literal_eval(data)
+    
+    def _read_metadata_safe(self, metadata_path):
+        try:
+            metadata = self._read_metadata(metadata_path)
+        except (OSError, ValueError, SyntaxError) as e:
+            print(f"Пропущены повреждённые метаданные {metadata_path}: {e}")
+            return None
+        if not isinstance(metadata, dict):
+            print(f"Пропущены повреждённые метаданные {metadata_path}")
+            return None
+        return metadata
     
     def list_files(self):
-        files = []
-        for file_id in os.listdir(self.metadata_path):
-            metadata_path = os.path.join(self.metadata_path, file_id)
-            with open(metadata_path, "r") as f:
-                metadata = eval(f.read())
-            files.append({
-                "id": file_id,
-                "filename": metadata["original_filename"],
-                "timestamp": metadata["timestamp"],
-                "size": metadata["size"]
-            })
-        return files
+        with self._index_lock:
+            rows = self._index.execute(
+                "SELECT id, original_filename, timestamp, size FROM files ORDER BY timestamp"
+            ).fetchall()
+        return [
+            {"id": row[0], "filename": row[1], "timestamp": row[2], "size": row[3]}
+            for row in rows
+        ]
     
     def delete_file(self, file_id):
-        encrypted_path = os.path.join(self.files_path, file_id)
-        metadata_path = os.path.join(self.metadata_path, file_id)
+        try:
+            os.unlink(self.file_path(file_id))
+        except FileNotFoundError:
+            raise FileNotFoundError(f"File {file_id} not found in vault") from None
+        self._add_file_count(-1)
         
-        if not os.path.exists(encrypted_path) or not os.path.exists(metadata_path):
-            raise FileNotFoundError(f"File {file_id} not found in vault")
-            
-        os.remove(encrypted_path)
-        os.remove(metadata_path)
+        try:
+            os.unlink(self.metadata_file_path(file_id))
+        except FileNotFoundError:
+            pass
+        with self._index_lock, self._index:
+            self._index.execute("DELETE FROM files WHERE id = ?", (file_id,))
 
 def main():
     if len(sys.argv) < 2:
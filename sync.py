@@ -2,22 +2,55 @@ import os
 import sys
 import json
 import time
+import shutil
+import tempfile
 import requests
 import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 from main import CryptoVault
 
+DROPBOX_CHUNK_SIZE = 8 * 1024 * 1024
+SYNC_WORKERS = 16
+# Каждый из SYNC_WORKERS файлов передаётся в S3_TRANSFER_CONCURRENCY
+# потоков, и пул соединений клиента рассчитан на все их одновременно
+S3_TRANSFER_CONCURRENCY = 4
+S3_MAX_POOL_CONNECTIONS = SYNC_WORKERS * S3_TRANSFER_CONCURRENCY
+
+def _atomic_write(path, data):
+    # Уникальное имя: CLI и фоновый поток могут писать одновременно.
+    # fsync до os.replace, иначе после сбоя файл может оказаться пустым
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
 class VaultSyncManager:
     def __init__(self, vault, sync_config_path=None):
         self.vault = vault
         self.sync_config_path = sync_config_path or os.path.join(vault.vault_path, "sync_config.json")
+        self.last_sync_path = os.path.join(os.path.dirname(self.sync_config_path), "last_sync")
         self.sync_lock = threading.Lock()
         self.sync_interval = 60
+        self.max_workers = SYNC_WORKERS
         self.providers = {
             "s3": S3SyncProvider,
             "dropbox": DropboxSyncProvider,
             "local": LocalSyncProvider
         }
+        self._provider = None
+        self._config_dirty = False
+        self.sync_thread = None
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
         self.load_config()
         
     def load_config(self):
@@ -29,66 +62,89 @@ class VaultSyncManager:
                 "enabled": False,
                 "provider": "local",
                 "settings": {},
-                "last_sync": None,
                 "sync_interval": 60
             }
+            self._config_dirty = True
             self.save_config()
             
     def save_config(self):
-        with open(self.sync_config_path, "w") as f:
-            json.dump(self.config, f, indent=2)
+        if not self._config_dirty:
+            return
+        _atomic_write(self.sync_config_path, json.dumps(self.config, indent=2))
+        self._config_dirty = False
+        
+    @property
+    def last_sync(self):
+        try:
+            with open(self.last_sync_path, "r") as f:
+                return int(f.read())
+        except (FileNotFoundError, ValueError):
+            return self.config.get("last_sync")
+            
+    def _record_sync(self):
+        _atomic_write(self.last_sync_path, str(int(time.time())))
             
     def get_provider(self):
+        if self._provider is not None:
+            return self._provider
+            
         provider_name = self.config.get("provider", "local")
         if provider_name not in self.providers:
             raise ValueError(f"Неизвестный провайдер: {provider_name}")
             
         provider_class = self.providers[provider_name]
-        return provider_class(self.vault, self.config.get("settings", {}))
+        self._provider = provider_class(self.vault, self.config.get("settings", {}))
+        return self._provider
         
     def start_sync_thread(self):
         if not self.config.get("enabled", False):
             print("Синхронизация отключена")
             return False
             
+        if self.sync_thread is not None and self.sync_thread.is_alive():
+            return True
+            
+        self._stop.clear()
         self.sync_thread = threading.Thread(target=self._sync_worker)
         self.sync_thread.daemon = True
         self.sync_thread.start()
         return True
         
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wakeup.set()
+        if self.sync_thread is not None:
+            self.sync_thread.join(timeout)
+            self.sync_thread = None
+            
+    def wake(self):
+        self._wakeup.set()
+        
     def _sync_worker(self):
-        while True:
+        while not self._stop.is_set():
             try:
                 with self.sync_lock:
                     self.sync()
-                    self.config["last_sync"] = int(time.time())
-                    self.save_config()
+                    self._record_sync()
             except Exception as e:
                 print(f"Ошибка синхронизации: {e}")
                 
-            time.sleep(self.config.get("sync_interval", 60))
+            self._wakeup.wait(self.config.get("sync_interval", 60))
+            self._wakeup.clear()
             
     def sync(self):
         provider = self.get_provider()
-        local_files = self._get_local_files()
-        remote_files = provider.list_files()
+        local_files = set(self._get_local_files())
+        remote_files = set(provider.list_files())
         
-        files_to_upload = [f for f in local_files if f not in remote_files]
-        files_to_download = [f for f in remote_files if f not in local_files]
+        files_to_upload = sorted(local_files - remote_files)
+        files_to_download = sorted(remote_files - local_files)
         
-        for file_id in files_to_upload:
-            print(f"Загрузка {file_id}...")
-            file_path = os.path.join(self.vault.files_path, file_id)
-            metadata_path = os.path.join(self.vault.metadata_path, file_id)
-            
-            provider.upload_file(file_id, file_path, metadata_path)
-            
-        for file_id in files_to_download:
-            print(f"Скачивание {file_id}...")
-            file_path = os.path.join(self.vault.files_path, file_id)
-            metadata_path = os.path.join(self.vault.metadata_path, file_id)
-            
-            provider.download_file(file_id, file_path, metadata_path)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(partial(self._upload_file, provider), files_to_upload))
+            list(executor.map(partial(self._download_file, provider), files_to_download))
+        if files_to_download:
+            self.vault.refresh_file_count()
             
         return {
             "uploaded": len(files_to_upload),
@@ -97,9 +153,24 @@ class VaultSyncManager:
             "total_local": len(local_files)
         }
             
+    def _upload_file(self, provider, file_id):
+        print(f"Загрузка {file_id}...")
+        file_path = self.vault.file_path(file_id)
+        metadata_path = self.vault.metadata_file_path(file_id)
+        
+        provider.upload_file(file_id, file_path, metadata_path)
+        
+    def _download_file(self, provider, file_id):
+        print(f"Скачивание {file_id}...")
+        file_path = self.vault.file_path(file_id)
+        metadata_path = self.vault.metadata_file_path(file_id)
+        
+        provider.download_file(file_id, file_path, metadata_path)
+        self.vault.register_metadata(file_id)
+            
     def _get_local_files(self):
-        return [f for f in os.listdir(self.vault.files_path) 
-                if os.path.isfile(os.path.join(self.vault.files_path, f))]
+        with os.scandir(self.vault.files_path) as entries:
+            return [entry.name for entry in entries if entry.is_file()]
                 
     def configure(self, provider, settings):
         if provider not in self.providers:
@@ -108,16 +179,21 @@ class VaultSyncManager:
         self.config["provider"] = provider
         self.config["settings"] = settings
         self.config["enabled"] = True
+        self._config_dirty = True
         self.save_config()
+        self._provider = None
         
         provider_instance = self.get_provider()
         provider_instance.validate_settings()
+        self.wake()
         
         return True
         
     def disable(self):
         self.config["enabled"] = False
+        self._config_dirty = True
         self.save_config()
+        self.stop()
         return True
 
 
@@ -159,7 +235,8 @@ class LocalSyncProvider(BaseSyncProvider):
         if not os.path.exists(files_dir):
             return []
             
-        return [f for f in os.listdir(files_dir) if os.path.isfile(os.path.join(files_dir, f))]
+        with os.scandir(files_dir) as entries:
+            return [entry.name for entry in entries if entry.is_file()]
         
     def upload_file(self, file_id, file_path, metadata_path):
         sync_dir = self.settings.get("sync_dir")
@@ -175,11 +252,8 @@ class LocalSyncProvider(BaseSyncProvider):
         remote_file_path = os.path.join(files_dir, file_id)
         remote_metadata_path = os.path.join(metadata_dir, file_id)
         
-        with open(file_path, "rb") as src, open(remote_file_path, "wb") as dst:
-            dst.write(src.read())
-            
-        with open(metadata_path, "r") as src, open(remote_metadata_path, "w") as dst:
-            dst.write(src.read())
+        shutil.copyfile(file_path, remote_file_path)
+        shutil.copyfile(metadata_path, remote_metadata_path)
         
     def download_file(self, file_id, file_path, metadata_path):
         sync_dir = self.settings.get("sync_dir")
@@ -195,14 +269,31 @@ class LocalSyncProvider(BaseSyncProvider):
         if not os.path.exists(remote_file_path) or not os.path.exists(remote_metadata_path):
             raise FileNotFoundError(f"Файл {file_id} не найден в удаленном хранилище")
             
-        with open(remote_file_path, "rb") as src, open(file_path, "wb") as dst:
-            dst.write(src.read())
-            
-        with open(remote_metadata_path, "r") as src, open(metadata_path, "w") as dst:
-            dst.write(src.read())
+        shutil.copyfile(remote_file_path, file_path)
+        shutil.copyfile(remote_metadata_path, metadata_path)
 
 
 class S3SyncProvider(BaseSyncProvider):
+    def __init__(self, vault, settings):
+        super().__init__(vault, settings)
+        self._s3 = None
+        self._client_lock = threading.Lock()
+        
+    @property
+    def s3(self):
+        with self._client_lock:
+            if self._s3 is None:
+                import boto3
+                from botocore.config import Config
+                self._s3 = boto3.client(
+                    's3',
+                    aws_access_key_id=self.settings["access_key"],
+                    aws_secret_access_key=self.settings["secret_key"],
+                    region_name=self.settings["region"],
+                    config=Config(max_pool_connections=S3_MAX_POOL_CONNECTIONS, retries={"mode": "adaptive"})
+                )
+            return self._s3
+        
     def validate_settings(self):
         required = ["access_key", "secret_key", "bucket", "region"]
         for field in required:
@@ -210,13 +301,6 @@ class S3SyncProvider(BaseSyncProvider):
                 raise ValueError(f"Отсутствует обязательное поле: {field}")
                 
         try:
-            import boto3
-            self.s3 = boto3.client(
-                's3',
-                aws_access_key_id=self.settings["access_key"],
-                aws_secret_access_key=self.settings["secret_key"],
-                region_name=self.settings["region"]
-            )
             self.s3.head_bucket(Bucket=self.settings["bucket"])
         except ImportError:
             raise ImportError("Для синхронизации с S3 необходимо установить boto3")
@@ -227,14 +311,6 @@ class S3SyncProvider(BaseSyncProvider):
         
     def list_files(self):
         try:
-            import boto3
-            self.s3 = boto3.client(
-                's3',
-                aws_access_key_id=self.settings["access_key"],
-                aws_secret_access_key=self.settings["secret_key"],
-                region_name=self.settings["region"]
-            )
-            
             response = self.s3.list_objects_v2(
                 Bucket=self.settings["bucket"],
                 Prefix="files/"
@@ -251,18 +327,11 @@ class S3SyncProvider(BaseSyncProvider):
         
     def upload_file(self, file_id, file_path, metadata_path):
         try:
-            import boto3
-            self.s3 = boto3.client(
-                's3',
-                aws_access_key_id=self.settings["access_key"],
-                aws_secret_access_key=self.settings["secret_key"],
-                region_name=self.settings["region"]
-            )
-            
             self.s3.upload_file(
                 file_path,
                 self.settings["bucket"],
-                f"files/{file_id}"
+                f"files/{file_id}",
+                Config=self._transfer_config()
             )
             
             self.s3.upload_file(
@@ -275,18 +344,11 @@ class S3SyncProvider(BaseSyncProvider):
         
     def download_file(self, file_id, file_path, metadata_path):
         try:
-            import boto3
-            self.s3 = boto3.client(
-                's3',
-                aws_access_key_id=self.settings["access_key"],
-                aws_secret_access_key=self.settings["secret_key"],
-                region_name=self.settings["region"]
-            )
-            
             self.s3.download_file(
                 self.settings["bucket"],
                 f"files/{file_id}",
-                file_path
+                file_path,
+                Config=self._transfer_config()
             )
             
             self.s3.download_file(
@@ -296,17 +358,36 @@ class S3SyncProvider(BaseSyncProvider):
             )
         except Exception as e:
             raise Exception(f"Ошибка скачивания файла из S3: {e}")
+            
+    def _transfer_config(self):
+        from boto3.s3.transfer import TransferConfig
+        return TransferConfig(
+            max_concurrency=S3_TRANSFER_CONCURRENCY,
+            multipart_chunksize=8 * 1024 * 1024,
+            use_threads=True
+        )
 
 
 class DropboxSyncProvider(BaseSyncProvider):
+    def __init__(self, vault, settings):
+        super().__init__(vault, settings)
+        self._dbx = None
+        self._client_lock = threading.Lock()
+        
+    @property
+    def dbx(self):
+        with self._client_lock:
+            if self._dbx is None:
+                import dropbox
+                self._dbx = dropbox.Dropbox(self.settings["access_token"])
+            return self._dbx
+        
     def validate_settings(self):
         if "access_token" not in self.settings:
             raise ValueError("Отсутствует токен доступа")
             
         try:
-            import dropbox
-            dbx = dropbox.Dropbox(self.settings["access_token"])
-            dbx.users_get_current_account()
+            self.dbx.users_get_current_account()
         except ImportError:
             raise ImportError("Для синхронизации с Dropbox необходимо установить dropbox")
         except Exception as e:
@@ -317,13 +398,12 @@ class DropboxSyncProvider(BaseSyncProvider):
     def list_files(self):
         try:
             import dropbox
-            dbx = dropbox.Dropbox(self.settings["access_token"])
             
-            result = dbx.files_list_folder("/files")
+            result = self.dbx.files_list_folder("/files")
             files = [entry.name for entry in result.entries if isinstance(entry, dropbox.files.FileMetadata)]
             
             while result.has_more:
-                result = dbx.files_list_folder_continue(result.cursor)
+                result = self.dbx.files_list_folder_continue(result.cursor)
                 files.extend([entry.name for entry in result.entries if isinstance(entry, dropbox.files.FileMetadata)])
                 
             return files
@@ -334,25 +414,42 @@ class DropboxSyncProvider(BaseSyncProvider):
     def upload_file(self, file_id, file_path, metadata_path):
         try:
             import dropbox
-            dbx = dropbox.Dropbox(self.settings["access_token"])
             
-            with open(file_path, "rb") as f:
-                dbx.files_upload(f.read(), f"/files/{file_id}", mode=dropbox.files.WriteMode.overwrite)
-                
+            self._upload_chunked(file_path, f"/files/{file_id}")
+            
             with open(metadata_path, "rb") as f:
-                dbx.files_upload(f.read(), f"/metadata/{file_id}", mode=dropbox.files.WriteMode.overwrite)
+                self.dbx.files_upload(f.read(), f"/metadata/{file_id}", mode=dropbox.files.WriteMode.overwrite)
         except Exception as e:
             raise Exception(f"Ошибка загрузки файла в Dropbox: {e}")
         
     def download_file(self, file_id, file_path, metadata_path):
         try:
-            import dropbox
-            dbx = dropbox.Dropbox(self.settings["access_token"])
-            
-            file_result = dbx.files_download_to_file(file_path, f"/files/{file_id}")
-            metadata_result = dbx.files_download_to_file(metadata_path, f"/metadata/{file_id}")
+            self.dbx.files_download_to_file(file_path, f"/files/{file_id}")
+            self.dbx.files_download_to_file(metadata_path, f"/metadata/{file_id}")
         except Exception as e:
             raise Exception(f"Ошибка скачивания файла из Dropbox: {e}")
+            
+    def _upload_chunked(self, local_path, remote_path):
+        import dropbox
+        mode = dropbox.files.WriteMode.overwrite
+        
+        with open(local_path, "rb") as f:
+            chunk = f.read(DROPBOX_CHUNK_SIZE)
+            next_chunk = f.read(DROPBOX_CHUNK_SIZE)
+            if not next_chunk:
+                self.dbx.files_upload(chunk, remote_path, mode=mode)
+                return
+                
+            session = self.dbx.files_upload_session_start(chunk)
+            cursor = dropbox.files.UploadSessionCursor(session_id=session.session_id, offset=len(chunk))
+            chunk = next_chunk
+            while next_chunk := f.read(DROPBOX_CHUNK_SIZE):
+                self.dbx.files_upload_session_append_v2(chunk, cursor)
+                cursor.offset += len(chunk)
+                chunk = next_chunk
+                
+            commit = dropbox.files.CommitInfo(path=remote_path, mode=mode)
+            self.dbx.files_upload_session_finish(chunk, cursor, commit)
 
 
 def main():
@@ -408,8 +505,8 @@ def main():
         print(f"  - Активна: {'Да' if config.get('enabled', False) else 'Нет'}")
         print(f"  - Провайдер: {config.get('provider', 'не настроен')}")
         
-        if config.get("last_sync"):
-            last_sync = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(config["last_sync"]))
+        if sync_manager.last_sync:
+            last_sync = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(sync_manager.last_sync))
             print(f"  - Последняя синхронизация: {last_sync}")
         else:
             print("  - Последняя синхронизация: никогда")
@@ -1,8 +1,24 @@
+import io
 import os
+import json
+import base64
+import hashlib
+import stat
+import struct
 import tempfile
+import threading
+import time
 import unittest
 import shutil
-from main import CryptoVault
+import sys
+import types
+from unittest import mock
+from cryptography.fernet import Fernet
+from main import (
+    CryptoVault, chunk_size_for, CHUNK_SIZE, LARGE_CHUNK_SIZE, HUGE_CHUNK_SIZE,
+    LARGE_FILE_THRESHOLD, HUGE_FILE_THRESHOLD, KEY_CACHE_TTL
+)
+import sync
 
 class TestCryptoVault(unittest.TestCase):
     def setUp(self):
@@ -22,8 +38,8 @@ class TestCryptoVault(unittest.TestCase):
     def test_encrypt_decrypt_file(self):
         file_id = self.vault.encrypt_file(self.test_file, self.password)
         
-        self.assertTrue(os.path.exists(os.path.join(self.vault.files_path, file_id)))
-        self.assertTrue(os.path.exists(os.path.join(self.vault.metadata_path, file_id)))
+        self.assertTrue(os.path.exists(self.vault.file_path(file_id)))
+        self.assertTrue(os.path.exists(self.vault.metadata_file_path(file_id)))
         
         output_file = os.path.join(self.test_dir, "decrypted_file.txt")
         result_path = self.vault.decrypt_file(file_id, self.password, output_file)
@@ -35,6 +51,152 @@ class TestCryptoVault(unittest.TestCase):
         
         self.assertEqual(decrypted_content, self.test_file_content)
     
+    def test_encrypt_decrypt_large_file(self):
+        content = os.urandom(3 * CHUNK_SIZE + 123)
+        large_file = os.path.join(self.test_dir, "large_file.bin")
+        with open(large_file, "wb") as f:
+            f.write(content)
+        
+        file_id = self.vault.encrypt_file(large_file, self.password)
+        
+        output_file = os.path.join(self.test_dir, "decrypted_large_file.bin")
+        self.vault.decrypt_file(file_id, self.password, output_file)
+        
+        with open(output_file, "rb") as f:
+            self.assertEqual(f.read(), content)
+    
+    def test_encrypt_stream(self):
+        file_id = self.vault.encrypt_stream(io.BytesIO(self.test_file_content), self.password, "stream.txt")
+        
+        files = self.vault.list_files()
+        self.assertEqual(files[0]["filename"], "stream.txt")
+        self.assertEqual(files[0]["size"], len(self.test_file_content))
+        
+        output_file = os.path.join(self.test_dir, "decrypted_stream.txt")
+        self.vault.decrypt_file(file_id, self.password, output_file)
+        
+        with open(output_file, "rb") as f:
+            self.assertEqual(f.read(), self.test_file_content)
+    
+    def test_chunk_size_for(self):
+        self.assertEqual(chunk_size_for(0), CHUNK_SIZE)
+        self.assertEqual(chunk_size_for(LARGE_FILE_THRESHOLD), LARGE_CHUNK_SIZE)
+        self.assertEqual(chunk_size_for(HUGE_FILE_THRESHOLD), HUGE_CHUNK_SIZE)
+        self.assertEqual(chunk_size_for(None), LARGE_CHUNK_SIZE)
+    
+    def test_encrypt_stream_read_error(self):
+        class FailingStream(io.BytesIO):
+            def read(self, size=-1):
+                if self.tell() >= CHUNK_SIZE:
+                    raise IOError("read failed")
+                return super().read(size)
+        
+        with self.assertRaises(IOError):
+            self.vault.encrypt_stream(FailingStream(os.urandom(3 * CHUNK_SIZE)), self.password, "broken.bin")
+        self.assertEqual(os.listdir(self.vault.files_path), [])
+    
+    def test_decrypt_stream(self):
+        file_id = self.vault.encrypt_file(self.test_file, self.password)
+        
+        chunks = self.vault.decrypt_stream(file_id, self.password)
+        self.assertEqual(b"".join(chunks), self.test_file_content)
+        
+        with self.assertRaises(ValueError):
+            self.vault.decrypt_stream(file_id, "wrong_password")
+    
+    def test_truncated_file(self):
+        large_file = os.path.join(self.test_dir, "large_file.bin")
+        with open(large_file, "wb") as f:
+            f.write(os.urandom(3 * CHUNK_SIZE))
+        
+        file_id = self.vault.encrypt_file(large_file, self.password)
+        
+        encrypted_path = self.vault.file_path(file_id)
+        with open(encrypted_path, "rb") as f:
+            encrypted_data = f.read()
+        with open(encrypted_path, "wb") as f:
+            f.write(encrypted_data[:len(encrypted_data) * 2 // 3])
+        
+        output_file = os.path.join(self.test_dir, "decrypted_large_file.bin")
+        with self.assertRaises(ValueError):
+            self.vault.decrypt_file(file_id, self.password, output_file)
+        self.assertFalse(os.path.exists(output_file))
+    
+    @unittest.skipIf(os.name == "nt", "POSIX-права и символические ссылки")
+    def test_decrypt_output_target(self):
+        file_id = self.vault.encrypt_file(self.test_file, self.password)
+        
+        umask = os.umask(0o022)
+        self.addCleanup(os.umask, umask)
+        new_file = os.path.join(self.test_dir, "new_file.txt")
+        self.vault.decrypt_file(file_id, self.password, new_file)
+        self.assertEqual(stat.S_IMODE(os.stat(new_file).st_mode), 0o644)
+        
+        existing_file = os.path.join(self.test_dir, "existing_file.txt")
+        with open(existing_file, "w") as f:
+            f.write("old")
+        os.chmod(existing_file, 0o640)
+        self.vault.decrypt_file(file_id, self.password, existing_file)
+        self.assertEqual(stat.S_IMODE(os.stat(existing_file).st_mode), 0o640)
+        
+        link = os.path.join(self.test_dir, "link.txt")
+        os.symlink(existing_file, link)
+        os.remove(existing_file)
+        self.vault.decrypt_file(file_id, self.password, link)
+        self.assertTrue(os.path.islink(link))
+        with open(existing_file, "rb") as f:
+            self.assertEqual(f.read(), self.test_file_content)
+        
+        self.vault.decrypt_file(file_id, self.password, os.devnull)
+        self.assertTrue(stat.S_ISCHR(os.stat(os.devnull).st_mode))
+        self.assertEqual(
+            sorted(os.listdir(self.test_dir)),
+            sorted(["existing_file.txt", "files", "index.db", "link.txt", "metadata", "new_file.txt", "test_file.txt"])
+        )
+    
+    def test_tampered_file(self):
+        file_id = self.vault.encrypt_file(self.test_file, self.password)
+        
+        encrypted_path = self.vault.file_path(file_id)
+        with open(encrypted_path, "r+b") as f:
+            f.seek(-1, os.SEEK_END)
+            last_byte = f.read(1)
+            f.seek(-1, os.SEEK_END)
+            f.write(bytes([last_byte[0] ^ 1]))
+        
+        output_file = os.path.join(self.test_dir, "decrypted_file.txt")
+        with self.assertRaises(ValueError):
+            self.vault.decrypt_file(file_id, self.password, output_file)
+        self.assertFalse(os.path.exists(output_file))
+    
+    def test_oversized_chunk_length(self):
+        file_id = self.vault.encrypt_file(self.test_file, self.password)
+        
+        with open(self.vault.file_path(file_id), "r+b") as f:
+            f.write(struct.pack(">I", 600 * 1024 * 1024))
+        
+        output_file = os.path.join(self.test_dir, "decrypted_file.txt")
+        with self.assertRaises(ValueError):
+            self.vault.decrypt_file(file_id, self.password, output_file)
+        with self.assertRaises(ValueError):
+            self.vault.decrypt_stream(file_id, self.password)
+        self.assertFalse(os.path.exists(output_file))
+    
+    def test_encrypt_decrypt_empty_file(self):
+        empty_file = os.path.join(self.test_dir, "empty_file.txt")
+        open(empty_file, "wb").close()
+        
+        file_id = self.vault.encrypt_file(empty_file, self.password)
+        
+        output_file = os.path.join(self.test_dir, "decrypted_empty_file.txt")
+        self.vault.decrypt_file(file_id, self.password, output_file)
+        
+        with open(output_file, "rb") as f:
+            self.assertEqual(f.read(), b"")
+        
+        with self.assertRaises(ValueError):
+            self.vault.decrypt_file(file_id, "wrong_password", output_file)
+    
     def test_list_files(self):
         file_id1 = self.vault.encrypt_file(self.test_file, self.password)
         
@@ -49,16 +211,87 @@ class TestCryptoVault(unittest.TestCase):
         self.assertIn(file_id1, [f["id"] for f in files])
         self.assertIn(file_id2, [f["id"] for f in files])
     
+    def test_encrypt_files_batch(self):
+        second_file = os.path.join(self.test_dir, "test_file2.txt")
+        with open(second_file, "wb") as f:
+            f.write(b"Another test file")
+        
+        file_ids = self.vault.encrypt_files([self.test_file, second_file], self.password)
+        
+        self.assertEqual(len(file_ids), 2)
+        self.assertEqual(sorted(f["id"] for f in self.vault.list_files()), sorted(file_ids))
+    
+    def test_rebuild_index_from_metadata(self):
+        file_id = self.vault.encrypt_file(self.test_file, self.password)
+        
+        with open(self.vault.index_path, "w") as f:
+            f.write("{}")
+        
+        vault = CryptoVault(self.test_dir)
+        files = vault.list_files()
+        
+        self.assertEqual([f["id"] for f in files], [file_id])
+        self.assertEqual(files[0]["size"], len(self.test_file_content))
+    
+    def test_rebuild_index_skips_corrupted_metadata(self):
+        file_id = self.vault.encrypt_file(self.test_file, self.password)
+        with open(os.path.join(self.vault.metadata_path, "broken"), "w") as f:
+            f.write("{not metadata")
+        
+        with open(self.vault.index_path, "w") as f:
+            f.write("{}")
+        with mock.patch.object(CryptoVault, "_insert_metadata", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                CryptoVault(self.test_dir)
+        
+        vault = CryptoVault(self.test_dir)
+        self.assertEqual([f["id"] for f in vault.list_files()], [file_id])
+    
+    def test_file_count(self):
+        self.assertEqual(self.vault.file_count, 0)
+        
+        file_id = self.vault.encrypt_file(self.test_file, self.password)
+        self.assertEqual(self.vault.file_count, 1)
+        self.assertEqual(CryptoVault(self.test_dir).file_count, 1)
+        
+        self.vault.delete_file(file_id)
+        self.assertEqual(self.vault.file_count, 0)
+    
+    def test_flush(self):
+        synced = []
+        sync = lambda fd: synced.append(os.fstat(fd).st_ino)
+        inode = lambda path: os.stat(path).st_ino
+        
+        with mock.patch("main.os.fsync", side_effect=sync):
+            file_id = self.vault.encrypt_file(self.test_file, self.password)
+        self.assertCountEqual(synced, [
+            inode(self.vault.file_path(file_id)),
+            inode(self.vault.metadata_file_path(file_id))
+        ])
+        
+        synced.clear()
+        with mock.patch("main.os.fsync", side_effect=sync):
+            self.vault.flush()
+        self.assertCountEqual(synced, [inode(self.vault.files_path), inode(self.vault.metadata_path)])
+        
+        synced.clear()
+        with mock.patch("main.os.fsync", side_effect=sync):
+            self.vault.flush()
+        self.assertEqual(synced, [])
+    
     def test_delete_file(self):
         file_id = self.vault.encrypt_file(self.test_file, self.password)
         
-        self.assertTrue(os.path.exists(os.path.join(self.vault.files_path, file_id)))
-        self.assertTrue(os.path.exists(os.path.join(self.vault.metadata_path, file_id)))
+        self.assertTrue(os.path.exists(self.vault.file_path(file_id)))
+        self.assertTrue(os.path.exists(self.vault.metadata_file_path(file_id)))
         
         self.vault.delete_file(file_id)
         
-        self.assertFalse(os.path.exists(os.path.join(self.vault.files_path, file_id)))
-        self.assertFalse(os.path.exists(os.path.join(self.vault.metadata_path, file_id)))
+        self.assertFalse(os.path.exists(self.vault.file_path(file_id)))
+        self.assertFalse(os.path.exists(self.vault.metadata_file_path(file_id)))
+        
+        with self.assertRaises(FileNotFoundError):
+            self.vault.delete_file(file_id)
     
     def test_wrong_password(self):
         file_id = self.vault.encrypt_file(self.test_file, self.password)
@@ -68,6 +301,28 @@ class TestCryptoVault(unittest.TestCase):
         with self.assertRaises(ValueError):
             self.vault.decrypt_file(file_id, "wrong_password", output_file)
     
+    def test_key_cache(self):
+        salt = os.urandom(16)
+        key, _ = self.vault.generate_key(self.password, salt)
+        
+        self.assertEqual(self.vault.generate_key(self.password, salt)[0], key)
+        self.assertNotEqual(self.vault.generate_key("wrong_password", salt)[0], key)
+        
+        self.vault.clear_key_cache()
+        self.assertEqual(len(self.vault._key_cache), 0)
+        self.assertEqual(self.vault.generate_key(self.password, salt)[0], key)
+    
+    def test_key_cache_expiry(self):
+        salt = os.urandom(16)
+        with mock.patch("main.time.monotonic", return_value=1000.0):
+            self.vault.generate_key(self.password, salt)
+        self.assertEqual(len(self.vault._key_cache), 1)
+        
+        with mock.patch("main.time.monotonic", return_value=1000.0 + KEY_CACHE_TTL):
+            self.vault.generate_key("other_password", salt)
+        self.assertEqual(len(self.vault._key_cache), 1)
+        self.assertNotIn((hashlib.sha256(self.password.encode()).digest(), salt), self.vault._key_cache)
+    
     def test_file_not_found(self):
         with self.assertRaises(FileNotFoundError):
             self.vault.encrypt_file("non_existent_file.txt", self.password)
@@ -75,12 +330,61 @@ class TestCryptoVault(unittest.TestCase):
         with self.assertRaises(FileNotFoundError):
             self.vault.decrypt_file("non_existent_file_id", self.password)
     
+    def test_missing_encrypted_file(self):
+        file_id = self.vault.encrypt_file(self.test_file, self.password)
+        metadata = self.vault.get_metadata(file_id)
+        os.remove(self.vault.file_path(file_id))
+        
+        with self.assertRaisesRegex(FileNotFoundError, "not found in vault"):
+            self.vault.decrypt_stream(file_id, self.password, metadata)
+        with self.assertRaisesRegex(FileNotFoundError, "not found in vault"):
+            self.vault.decrypt_file(file_id, self.password, os.path.join(self.test_dir, "out.txt"), metadata)
+    
+    def test_legacy_metadata(self):
+        file_id = self.vault.encrypt_file(self.test_file, self.password)
+        
+        metadata_path = self.vault.metadata_file_path(file_id)
+        with open(metadata_path, "r") as f:
+            metadata = json.load(f)
+        with open(metadata_path, "w") as f:
+            f.write(str(metadata))
+        with open(self.vault.index_path, "w") as f:
+            f.write("{}")
+        
+        vault = CryptoVault(self.test_dir)
+        files = vault.list_files()
+        self.assertEqual(files[0]["filename"], os.path.basename(self.test_file))
+        
+        output_file = os.path.join(self.test_dir, "decrypted_file.txt")
+        vault.decrypt_file(file_id, self.password, output_file)
+        
+        with open(output_file, "rb") as f:
+            self.assertEqual(f.read(), self.test_file_content)
+    
+    def test_legacy_fernet_file(self):
+        file_id = self.vault.encrypt_file(self.test_file, self.password)
+        metadata = self.vault.get_metadata(file_id)
+        key, _ = self.vault.generate_key(self.password, base64.b64decode(metadata["salt"]))
+        
+        with open(self.vault.file_path(file_id), "wb") as f:
+            f.write(Fernet(key).encrypt(self.test_file_content))
+        legacy = {name: metadata[name] for name in ["original_path", "original_filename", "timestamp", "salt"]}
+        with open(self.vault.metadata_file_path(file_id), "w") as f:
+            f.write(str(legacy))
+        with open(self.vault.index_path, "w") as f:
+            f.write("{}")
+        
+        vault = CryptoVault(self.test_dir)
+        self.assertEqual(b"".join(vault.decrypt_stream(file_id, self.password)), self.test_file_content)
+        with self.assertRaises(ValueError):
+            vault.decrypt_stream(file_id, "wrong_password")
+    
     def test_file_metadata(self):
         file_id = self.vault.encrypt_file(self.test_file, self.password)
         
-        metadata_path = os.path.join(self.vault.metadata_path, file_id)
+        metadata_path = self.vault.metadata_file_path(file_id)
         with open(metadata_path, "r") as f:
-            metadata = eval(f.read())
+            metadata = json.load(f)
         
         self.assertEqual(metadata["original_path"], self.test_file)
         self.assertEqual(metadata["original_filename"], os.path.basename(self.test_file))
@@ -88,5 +392,291 @@ class TestCryptoVault(unittest.TestCase):
         self.assertIn("timestamp", metadata)
         self.assertIn("salt", metadata)
 
+class FakeDropbox:
+    def __init__(self):
+        self.calls = []
+        self.uploaded = []
+    
+    def files_upload(self, data, path, mode):
+        self.calls.append(("upload", len(data)))
+        self.uploaded.append(data)
+    
+    def files_upload_session_start(self, data):
+        self.calls.append(("start", len(data)))
+        self.uploaded.append(data)
+        return types.SimpleNamespace(session_id="session")
+    
+    def files_upload_session_append_v2(self, data, cursor):
+        self.calls.append(("append", cursor.offset, len(data)))
+        self.uploaded.append(data)
+    
+    def files_upload_session_finish(self, data, cursor, commit):
+        self.calls.append(("finish", cursor.offset, len(data)))
+        self.uploaded.append(data)
+
+class TestVaultSync(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        self.vault = CryptoVault(os.path.join(self.test_dir, "vault"))
+        self.manager = sync.VaultSyncManager(self.vault)
+        self.password = "test_password"
+    
+    def test_local_sync_round_trip(self):
+        sync_dir = os.path.join(self.test_dir, "remote")
+        test_file = os.path.join(self.test_dir, "test_file.txt")
+        with open(test_file, "wb") as f:
+            f.write(b"synced content")
+        file_id = self.vault.encrypt_file(test_file, self.password)
+        
+        self.manager.configure("local", {"sync_dir": sync_dir})
+        self.assertEqual(self.manager.sync()["uploaded"], 1)
+        
+        other_vault = CryptoVault(os.path.join(self.test_dir, "other_vault"))
+        other_manager = sync.VaultSyncManager(other_vault)
+        other_manager.configure("local", {"sync_dir": sync_dir})
+        self.assertEqual(other_manager.sync()["downloaded"], 1)
+        
+        self.assertEqual([f["id"] for f in other_vault.list_files()], [file_id])
+        self.assertEqual(other_vault.file_count, 1)
+        self.assertEqual(b"".join(other_vault.decrypt_stream(file_id, self.password)), b"synced content")
+        self.assertEqual(other_manager.sync(), {"uploaded": 0, "downloaded": 0, "total_remote": 1, "total_local": 1})
+    
+    def test_dropbox_chunked_upload(self):
+        chunk_size = 8
+        fake_dropbox = types.SimpleNamespace(files=types.SimpleNamespace(
+            WriteMode=types.SimpleNamespace(overwrite="overwrite"),
+            UploadSessionCursor=types.SimpleNamespace,
+            CommitInfo=types.SimpleNamespace
+        ))
+        
+        for size, expected in [
+            (0, [("upload", 0)]),
+            (chunk_size, [("upload", chunk_size)]),
+            (chunk_size + 1, [("start", chunk_size), ("finish", chunk_size, 1)]),
+            (2 * chunk_size, [("start", chunk_size), ("finish", chunk_size, chunk_size)]),
+            (2 * chunk_size + 5, [
+                ("start", chunk_size),
+                ("append", chunk_size, chunk_size),
+                ("finish", 2 * chunk_size, 5)
+            ]),
+        ]:
+            with self.subTest(size=size):
+                content = os.urandom(size)
+                local_path = os.path.join(self.test_dir, "upload.bin")
+                with open(local_path, "wb") as f:
+                    f.write(content)
+                
+                dbx = FakeDropbox()
+                provider = sync.DropboxSyncProvider(self.vault, {"access_token": "token"})
+                provider._dbx = dbx
+                with mock.patch.dict(sys.modules, {"dropbox": fake_dropbox}), \
+                        mock.patch("sync.DROPBOX_CHUNK_SIZE", chunk_size):
+                    provider._upload_chunked(local_path, "/files/upload.bin")
+                
+                self.assertEqual(dbx.calls, expected)
+                self.assertEqual(b"".join(dbx.uploaded), content)
+    
+    def test_sync_thread_wake_and_disable(self):
+        self.manager.configure("local", {"sync_dir": os.path.join(self.test_dir, "remote")})
+        runs = []
+        ran = threading.Event()
+        
+        def fake_sync():
+            runs.append(time.monotonic())
+            ran.set()
+        
+        with mock.patch.object(self.manager, "sync", side_effect=fake_sync):
+            self.assertTrue(self.manager.start_sync_thread())
+            self.assertTrue(ran.wait(5))
+            
+            ran.clear()
+            self.manager.wake()
+            self.assertTrue(ran.wait(5))
+            
+            thread = self.manager.sync_thread
+            started = time.monotonic()
+            self.manager.disable()
+            self.assertLess(time.monotonic() - started, 5)
+        
+        self.assertFalse(thread.is_alive())
+        self.assertIsNone(self.manager.sync_thread)
+        self.assertEqual(len(runs), 2)
+        self.assertFalse(self.manager.start_sync_thread())
+    
+    def test_atomic_write(self):
+        path = os.path.join(self.test_dir, "config.json")
+        with mock.patch("sync.os.fsync", wraps=os.fsync) as fsync:
+            sync._atomic_write(path, "{}")
+        
+        fsync.assert_called_once()
+        with open(path) as f:
+            self.assertEqual(f.read(), "{}")
+        self.assertEqual(sorted(os.listdir(self.test_dir)), ["config.json", "vault"])
+    
+    def test_save_config_only_when_dirty(self):
+        with mock.patch("sync._atomic_write") as atomic_write:
+            self.manager.save_config()
+            atomic_write.assert_not_called()
+            
+            self.manager.config["sync_interval"] = 5
+            self.manager._config_dirty = True
+            self.manager.save_config()
+            self.manager.save_config()
+        atomic_write.assert_called_once()
+    
+    def test_last_sync(self):
+        self.assertIsNone(self.manager.last_sync)
+        
+        # Старые конфигурации хранили время синхронизации в sync_config.json
+        self.manager.config["last_sync"] = 123
+        self.assertEqual(self.manager.last_sync, 123)
+        
+        with mock.patch("sync.time.time", return_value=456.7):
+            self.manager._record_sync()
+        self.assertEqual(self.manager.last_sync, 456)
+
+class TestVaultApi(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # vault_api при импорте создаёт хранилище в домашнем каталоге
+        cls.home_dir = tempfile.mkdtemp()
+        with mock.patch.dict(os.environ, {"HOME": cls.home_dir, "USERPROFILE": cls.home_dir}):
+            import vault_api
+        cls.vault_api = vault_api
+    
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.home_dir)
+    
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        self.temp_dir = os.path.join(self.test_dir, "tmp")
+        os.makedirs(self.temp_dir)
+        
+        self.vault = CryptoVault(os.path.join(self.test_dir, "vault"))
+        for patcher in [
+            mock.patch.object(self.vault_api, "vault", self.vault),
+            mock.patch.object(tempfile, "tempdir", self.temp_dir)
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        
+        self.client = self.vault_api.app.test_client()
+        self.content = os.urandom(3 * CHUNK_SIZE + 123)
+        self.password = "test_password"
+    
+    def upload(self, filename="test_file.bin"):
+        response = self.client.post("/api/files", data={
+            "file": (io.BytesIO(self.content), filename),
+            "password": self.password
+        }, content_type="multipart/form-data")
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()["file_id"]
+    
+    def test_download_stream(self):
+        file_id = self.upload()
+        
+        response = self.client.get(f"/api/files/{file_id}?password={self.password}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/octet-stream")
+        self.assertEqual(response.headers["Content-Length"], str(len(self.content)))
+        self.assertEqual(response.data, self.content)
+    
+    def test_download_non_ascii_filename(self):
+        file_id = self.upload("héllo name.txt")
+        self.assertEqual(self.vault.get_metadata(file_id)["original_filename"], "héllo name.txt")
+        
+        response = self.client.get(f"/api/files/{file_id}?password={self.password}")
+        self.assertEqual(
+            response.headers["Content-Disposition"],
+            "attachment; filename=hello_name.txt; filename*=UTF-8''h%C3%A9llo%20name.txt"
+        )
+    
+    def test_upload_filename_strips_path(self):
+        file_id = self.upload("../../etc/passwd")
+        self.assertEqual(self.vault.get_metadata(file_id)["original_path"], "passwd")
+    
+    def test_download_wrong_password(self):
+        file_id = self.upload()
+        
+        response = self.client.get(f"/api/files/{file_id}?password=wrong_password")
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.get_json(), {"error": "Invalid password or corrupted file"})
+    
+    def test_download_raw_range(self):
+        file_id = self.upload()
+        
+        response = self.client.get(f"/api/files/{file_id}/raw?password={self.password}", headers={"Range": "bytes=10-19"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, self.content[10:20])
+        self.assertEqual(response.headers["Content-Range"], f"bytes 10-19/{len(self.content)}")
+        self.assertEqual(response.headers["Content-Disposition"], "attachment; filename=test_file.bin")
+        self.assertEqual(os.listdir(self.temp_dir), [])
+        response.close()
+    
+    @unittest.skipIf(os.name == "nt", "открытый файл нельзя удалить на Windows")
+    def test_download_raw_file_wrapper(self):
+        from werkzeug.test import EnvironBuilder
+        from werkzeug.wsgi import FileWrapper
+        file_id = self.upload()
+        
+        class RecordingFileWrapper(FileWrapper):
+            pass
+        
+        environ = EnvironBuilder(path=f"/api/files/{file_id}/raw", query_string={"password": self.password}).get_environ()
+        environ["wsgi.file_wrapper"] = RecordingFileWrapper
+        app_iter = self.vault_api.app(environ, lambda status, headers: None)
+        try:
+            # Сервер получает wsgi.file_wrapper напрямую и может отдать файл через sendfile
+            self.assertIsInstance(app_iter, RecordingFileWrapper)
+            self.assertEqual(b"".join(app_iter), self.content)
+        finally:
+            app_iter.close()
+        self.assertEqual(os.listdir(self.temp_dir), [])
+    
+    def test_download_raw_remove_on_close(self):
+        file_id = self.upload()
+        
+        remove = os.remove
+        with mock.patch("vault_api.os.remove", side_effect=[PermissionError, None]) as mock_remove:
+            response = self.client.get(f"/api/files/{file_id}/raw?password={self.password}")
+            self.assertEqual(response.data, self.content)
+            self.assertEqual(len(os.listdir(self.temp_dir)), 1)
+            
+            mock_remove.side_effect = remove
+            response.close()
+        self.assertEqual(os.listdir(self.temp_dir), [])
+    
+    def test_download_raw_wrong_password(self):
+        file_id = self.upload()
+        
+        response = self.client.get(f"/api/files/{file_id}/raw?password=wrong_password")
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.get_json(), {"error": "Invalid password or corrupted file"})
+        self.assertEqual(os.listdir(self.temp_dir), [])
+    
+    def test_orjson_provider_matches_default(self):
+        if getattr(self.vault_api, "OrjsonProvider", None) is None:
+            self.skipTest("orjson is not installed")
+        from datetime import datetime
+        from flask.json.provider import DefaultJSONProvider
+        
+        app = self.vault_api.app
+        payload = {
+            "files": [{"id": "abc", "filename": "héllo.txt", "size": 3}],
+            "timestamp": datetime(2024, 1, 2, 3, 4, 5),
+            "count": 1
+        }
+        with app.app_context():
+            responses = [
+                provider.response(payload)
+                for provider in [self.vault_api.OrjsonProvider(app), DefaultJSONProvider(app)]
+            ]
+        
+        self.assertEqual(responses[0].mimetype, responses[1].mimetype)
+        self.assertEqual(json.loads(responses[0].data), json.loads(responses[1].data))
+
 if __name__ == "__main__":
     unittest.main() 
\ No newline at end of file
@@ -1,13 +1,49 @@
 import os
 import json
-import base64
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
+from werkzeug.utils import secure_filename
+from urllib.parse import quote
 from main import CryptoVault
 import tempfile
 
+try:
+    import orjson
+    from flask.json.provider import DefaultJSONProvider
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    class OrjsonProvider(DefaultJSONProvider):
+        def dumps(self, obj, **kwargs):
+            return self._dumps(obj).decode()
+        
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+        
+        def response(self, *args, **kwargs):
+            obj = self._prepare_response_obj(args, kwargs)
+            return self._app.response_class(self._dumps(obj), mimetype=self.mimetype)
+        
+        def _dumps(self, obj):
+            # Даты и dataclass передаются в default, как у стандартного
+            # провайдера Flask, чтобы ответы не зависели от наличия orjson
+            option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            return orjson.dumps(obj, default=self.default, option=option)
+
 app = Flask(__name__)
+if orjson is not None:
+    app.json = OrjsonProvider(app)
 vault = CryptoVault()
 
+def upload_filename(filename):
+    # secure_filename отбрасывает все не-ASCII символы, поэтому от имени
+    # загружаемого файла отрезаются только путь и управляющие символы
+    name = os.path.basename(filename.replace('\\', '/'))
+    name = ''.join(c for c in name if c.isprintable()).strip()
+    return name if name not in ('', '.', '..') else 'file'
+
 @app.route('/api/files', methods=['GET'])
 def list_files():
     files = vault.list_files()
@@ -27,19 +63,11 @@ def encrypt_file():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
     
-    temp_file_path = None
     try:
-        with tempfile.NamedTemporaryFile(delete=False) as temp:
-            temp_file_path = temp.name
-            file.save(temp_file_path)
-        
-        file_id = vault.encrypt_file(temp_file_path, password)
+        file_id = vault.encrypt_stream(file.stream, password, upload_filename(file.filename), request.content_length)
         return jsonify({'file_id': file_id, 'message': 'File encrypted successfully'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        if temp_file_path and os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
 
 @app.route('/api/files/<file_id>', methods=['GET'])
 def decrypt_file(file_id):
@@ -49,28 +77,49 @@ def decrypt_file(file_id):
         return jsonify({'error': 'Password is required'}), 400
     
     try:
-        temp_output = tempfile.NamedTemporaryFile(delete=False)
-        temp_output.close()
-        
-        output_path = vault.decrypt_file(file_id, password, temp_output.name)
-        
-        with open(output_path, 'rb') as f:
-            file_data = f.read()
-        
-        os.remove(output_path)
-        
-        metadata_path = os.path.join(vault.metadata_path, file_id)
-        with open(metadata_path, 'r') as f:
-            metadata = eval(f.read())
-        
-        return jsonify({
-            'file_id': file_id,
-            'filename': metadata['original_filename'],
-            'data': base64.b64encode(file_data).decode('utf-8'),
-            'size': len(file_data)
-        })
+        metadata = vault.get_metadata(file_id)
+        chunks = vault.decrypt_stream(file_id, password, metadata)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+    
+    response = Response(stream_with_context(chunks), mimetype='application/octet-stream')
+    filename = metadata['original_filename']
+    response.headers.set(
+        'Content-Disposition', 'attachment',
+        filename=secure_filename(filename) or 'file',
+        **{'filename*': "UTF-8''" + quote(filename)}
+    )
+    response.headers['Content-Length'] = metadata['size']
+    return response
+
+@app.route('/api/files/<file_id>/raw', methods=['GET'])
+def download_file(file_id):
+    password = request.args.get('password')
+    
+    if not password:
+        return jsonify({'error': 'Password is required'}), 400
+    
+    temp_output = tempfile.NamedTemporaryFile(delete=False)
+    temp_output.close()
+    
+    try:
+        metadata = vault.get_metadata(file_id)
+        output_path = vault.decrypt_file(file_id, password, temp_output.name, metadata)
+    except Exception as e:
+        os.remove(temp_output.name)
+        return jsonify({'error': str(e)}), 500
+    
+    response = send_file(output_path, download_name=metadata['original_filename'], as_attachment=True, max_age=0)
+    try:
+        # send_file уже открыл файл: на POSIX его можно удалить сразу, данные
+        # читаются через открытый дескриптор, а сервер может отдать их через sendfile
+        os.remove(output_path)
+    except OSError:
+        # Windows не даёт удалить открытый файл. При direct_passthrough
+        # call_on_close не вызывается, поэтому файл удаляется при закрытии ответа
+        response.direct_passthrough = False
+        response.call_on_close(lambda: os.remove(output_path))
+    return response
 
 @app.route('/api/files/<file_id>', methods=['DELETE'])
 def delete_file(file_id):
@@ -80,16 +129,33 @@ def delete_file(file_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.teardown_request
+def flush_vault(exc=None):
+    vault.flush()
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({
         'status': 'healthy',
         'vault_path': vault.vault_path,
-        'files_count': len(os.listdir(vault.files_path)) if os.path.exists(vault.files_path) else 0
+        'files_count': vault.file_count
     })
 
 def start_api(host='0.0.0.0', port=5000, debug=False):
-    app.run(host=host, port=port, debug=debug)
+    if debug:
+        app.run(host=host, port=port, debug=debug)
+        return
+    
+    from waitress import serve
+    serve(app, host=host, port=port, threads=(os.cpu_count() or 1) * 2)
 
 if __name__ == '__main__':
-    start_api(debug=True) 
\ No newline at end of file
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="REST API сервер CryptoVault")
+    parser.add_argument("--host", help="Адрес для прослушивания (по умолчанию 0.0.0.0, с --debug 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=5000, help="Порт (по умолчанию 5000)")
+    parser.add_argument("--debug", action="store_true", help="Отладочный сервер Flask вместо waitress")
+    args = parser.parse_args()
+    
+    start_api(host=args.host or ('127.0.0.1' if args.debug else '0.0.0.0'), port=args.port, debug=args.debug) 